@@ -1,11 +1,10 @@
 import math
-import itertools
 import pandas as pd
 import numpy as np
-import sklearn.preprocessing as pre
 import streamlit as st
 
 import queries
+import utils
 
 
 def percent_to_population(feature: str, name: str, df: pd.DataFrame) -> pd.DataFrame:
@@ -14,20 +13,22 @@ def percent_to_population(feature: str, name: str, df: pd.DataFrame) -> pd.DataF
     return df
 
 
+CROSS_FEATURE_COLS = ['Pop Below Poverty Level', 'Pop Unemployed', 'Income Inequality (Ratio)',
+                      'Non-Home Ownership Pop', 'Num Burdened Households', 'Num Single Parent Households']
+# Pairwise (i, j) column index arrays and the resulting crossed-column
+# names, computed once at import rather than on every call.
+_CROSS_I, _CROSS_J = np.triu_indices(len(CROSS_FEATURE_COLS), k=1)
+_CROSS_NAMES = ['_X_'.join((CROSS_FEATURE_COLS[i], CROSS_FEATURE_COLS[j]))
+                for i, j in zip(_CROSS_I, _CROSS_J)]
+
+
 def cross_features(df: pd.DataFrame) -> pd.DataFrame:
-    cols = ['Pop Below Poverty Level', 'Pop Unemployed', 'Income Inequality (Ratio)', 'Non-Home Ownership Pop',
-            'Num Burdened Households', 'Num Single Parent Households']
-    all_combinations = []
-    for r in range(2, 3):
-        combinations_list = list(itertools.combinations(cols, r))
-        all_combinations += combinations_list
-    new_cols = []
-    for combo in all_combinations:
-        new_cols.append(cross(combo, df))
-
-    crossed_df = pd.DataFrame(new_cols)
-    crossed_df = crossed_df.T
-    crossed_df['Mean'] = crossed_df.mean(axis=1)
+    # All 15 pairwise products in one array operation instead of one
+    # pandas product call per column pair.
+    values = df[CROSS_FEATURE_COLS].to_numpy(dtype=np.float64)
+    crossed = np.abs(values[:, _CROSS_I] * values[:, _CROSS_J])
+    crossed_df = pd.DataFrame(crossed, index=df.index, columns=_CROSS_NAMES)
+    crossed_df['Mean'] = crossed.mean(axis=1)
 
     return crossed_df
 
@@ -40,34 +41,48 @@ def prepare_analysis_data(df: pd.DataFrame) -> pd.DataFrame:
                     'Single Parent Households (%)',
                     'Non-White Population (%)',
                     ]
-    for col in list(temp_df.columns):
-        if '(%)' in col:
-            if col == 'Unemployment Rate (%)':
-                temp_df = percent_to_population('Unemployment Rate (%)', 'Population Unemployed', temp_df)
-            else:
-                temp_df = percent_to_population(col, col.replace(' (%)', ''), temp_df)
-
-    if 'Policy Value' in list(temp_df.columns) or 'Countdown' in list(temp_df.columns):
-        temp_df = temp_df.drop(['Policy Value', 'Countdown'], axis=1)
-
-    for col in cols_to_drop:
-        try:
-            temp_df.drop([col], axis=1, inplace=True)
-        except:
-            pass
+    # Convert every percentage column in one pass: the population column is
+    # cast and scaled once, then broadcast against the percentage matrix,
+    # instead of re-casting both inside percent_to_population per column.
+    pct_cols = [col for col in temp_df.columns if '(%)' in col]
+    if pct_cols:
+        new_names = ['Population Unemployed' if col == 'Unemployment Rate (%)' else col.replace(' (%)', '')
+                     for col in pct_cols]
+        population = temp_df['Total Population'].to_numpy(dtype=np.float64) * 1000
+        populations = temp_df[pct_cols].to_numpy(dtype=np.float64) / 100 * population[:, None]
+        # percent_to_population overwrote existing columns, so drop any
+        # that are about to be recomputed rather than duplicating them.
+        temp_df = temp_df.drop(columns=[col for col in new_names if col in temp_df.columns])
+        temp_df = pd.concat(
+            [temp_df, pd.DataFrame(populations, index=temp_df.index, columns=new_names)],
+            axis=1, copy=False)
+
+    # One drop for everything that should go, instead of a frame
+    # reallocation per column inside a try/except loop.
+    drop_cols = [col for col in cols_to_drop + ['Policy Value', 'Countdown'] if col in temp_df.columns]
+    if drop_cols:
+        temp_df.drop(columns=drop_cols, inplace=True)
     return temp_df
 
 
 def normalize(df: pd.DataFrame) -> pd.DataFrame:
-    scaler = pre.MaxAbsScaler()
-    df_scaled = pd.DataFrame(scaler.fit_transform(df), index=df.index, columns=df.columns)
+    # Max-abs scaling is just a column-wise divide; doing it directly
+    # skips sklearn's estimator setup, input validation, and extra copy.
+    arr = df.to_numpy(dtype=np.float64)
+    maxabs = np.abs(arr).max(axis=0)
+    maxabs[maxabs == 0] = 1.0
+    df_scaled = pd.DataFrame(arr / maxabs, index=df.index, columns=df.columns)
 
     return df_scaled
 
 
 def normalize_column(df: pd.DataFrame, col: str) -> pd.DataFrame:
-    scaler = pre.MaxAbsScaler()
-    df[col] = scaler.fit_transform(df[col].values.reshape(-1, 1))
+    col_arr = df[col].to_numpy(dtype=np.float64)
+    max_abs = np.abs(col_arr).max()
+    # Columns coming out of normalize/cross_features are often already
+    # max-abs scaled; skip the divide (and its copy) when so.
+    if max_abs and not math.isclose(max_abs, 1.0):
+        df[col] = col_arr / max_abs
 
     return df
 
@@ -79,7 +94,10 @@ def normalize_percent(percent: float) -> float:
 def cross(columns: tuple, df: pd.DataFrame) -> pd.Series:
     columns = list(columns)
     new_col = '_X_'.join(columns)
-    new_series = pd.Series(df[columns].product(axis=1), name=new_col).abs()
+    # Known-float inputs: take the row product directly in NumPy rather
+    # than through pandas' NA-aware reduction machinery.
+    arr = df[columns].to_numpy(dtype=np.float64)
+    new_series = pd.Series(np.abs(np.prod(arr, axis=1)), index=df.index, name=new_col)
     return new_series
 
 
@@ -99,18 +117,22 @@ def rank_counties(df: pd.DataFrame, label: str) -> pd.DataFrame:
     # analysis_df['Crossed'] = crossed['Mean']
     # analysis_df = normalize_column(analysis_df, 'Crossed')
 
-    analysis_df['Relative Risk'] = analysis_df.sum(axis=1)
-    max_sum = analysis_df['Relative Risk'].max()
-    analysis_df['Relative Risk'] = (analysis_df['Relative Risk'] / max_sum)
+    # One sweep over the normalized matrix for the row sums, scaled by
+    # the max in the same ndarray rather than via three pandas reductions.
+    risk = analysis_df.to_numpy(dtype=np.float64).sum(axis=1)
+    analysis_df['Relative Risk'] = risk / risk.max()
 
     if 'Policy Value' in list(df.columns):
         analysis_df['Policy Value'] = df['Policy Value']
         analysis_df['Countdown'] = df['Countdown']
-        analysis_df['Rank'] = analysis_df.apply(
-            lambda x: priority_indicator(x['Relative Risk'], x['Policy Value'], x['Countdown']), axis=1
-        )
+        # Same arithmetic as priority_indicator, applied to whole columns
+        # instead of one Python call per county row.
+        time_left = np.maximum(analysis_df['Countdown'].to_numpy(dtype=np.float64), 1.0)
+        analysis_df['Rank'] = (analysis_df['Relative Risk'].to_numpy(dtype=np.float64)
+                               * (1.0 - analysis_df['Policy Value'].to_numpy(dtype=np.float64))
+                               / np.sqrt(time_left))
 
-    analysis_df.to_excel('Output/' + label + '_overall_vulnerability.xlsx')
+    utils.write_excel_stream(analysis_df, 'Output/' + label + '_overall_vulnerability.xlsx')
 
     return analysis_df
 
@@ -125,12 +147,18 @@ def calculate_cost_estimate(df: pd.DataFrame, pct_burdened: float, distribution:
 
     df = df.reset_index().merge(cost_df, how="left", on='county_id').set_index(['State', 'County Name'])
 
-    df['br_cost_0'] = distribution[0] * df[f'{rent_type}_0'] * (df['Renter Occupied Units']) * (df['burdened_households'] / 100) * (pct_burdened / 100)
-    df['br_cost_1'] = distribution[1] * df[f'{rent_type}_1'] * (df['Renter Occupied Units']) * (df['burdened_households'] / 100) * (pct_burdened / 100)
-    df['br_cost_2'] = distribution[2] * df[f'{rent_type}_2'] * (df['Renter Occupied Units']) * (df['burdened_households'] / 100) * (pct_burdened / 100)
-    df['br_cost_3'] = distribution[3] * df[f'{rent_type}_3'] * (df['Renter Occupied Units']) * (df['burdened_households'] / 100) * (pct_burdened / 100)
-    df['br_cost_4'] = distribution[4] * df[f'{rent_type}_4'] * (df['Renter Occupied Units']) * (df['burdened_households'] / 100) * (pct_burdened / 100)
-    df['total_cost'] = np.sum([df['br_cost_0'], df['br_cost_1'], df['br_cost_2'], df['br_cost_3'], df['br_cost_4']], axis=0)
+    # The renter/burdened factor is identical for all five bedroom sizes,
+    # so compute it once and broadcast it against the rent matrix instead
+    # of rebuilding it per br_cost column.
+    rents = df[[f'{rent_type}_{i}' for i in range(5)]].to_numpy(dtype=np.float64)
+    dist = np.array([distribution[i] for i in range(5)], dtype=np.float64)
+    common = (df['Renter Occupied Units'].to_numpy(dtype=np.float64)
+              * df['burdened_households'].to_numpy(dtype=np.float64) / 100
+              * (pct_burdened / 100))
+    br_costs = rents * dist[None, :] * common[:, None]
+    cost_df = pd.DataFrame(br_costs, index=df.index, columns=[f'br_cost_{i}' for i in range(5)])
+    cost_df['total_cost'] = br_costs.sum(axis=1)
+    df = pd.concat([df, cost_df], axis=1, copy=False)
     return df
 
 
@@ -1,3 +1,4 @@
+import pandas as pd
 import streamlit as st
 
 import queries
@@ -6,6 +7,22 @@ import visualization
 from constants import STATES
 
 
+@st.experimental_memo(ttl=1200)
+def _feature_labels(columns: tuple, excluded: tuple) -> list:
+    """Sorted selectable features, cached per column layout so the set
+    difference and sort don't rerun on every widget change."""
+    labels = list(set(columns) - set(excluded))
+    labels.sort()
+    return labels
+
+
+@st.experimental_memo(ttl=1200)
+def _reset_index_view(df: pd.DataFrame) -> pd.DataFrame:
+    """Memoized reset-index copy so widget reruns reuse the same view
+    instead of re-materializing the State/County index into columns."""
+    return df.reset_index()
+
+
 def county_data_explorer():
     task = st.selectbox('How much data do you want to look at?', ['Counties', 'State', 'National'], 0)
     state, counties, name, df = None, None, None, None
@@ -33,17 +50,17 @@ def county_data_explorer():
     if df is not None:
         if st.checkbox('Show raw data'):
             st.subheader('Raw Data')
-            tmp_df = df.copy()
-            st.caption(str(tmp_df.shape))
-            st.dataframe(tmp_df)
+            st.caption(str(df.shape))
+            if len(df) > 200:
+                st.caption('Preview limited to the first 200 rows; the download contains the full table.')
+            st.dataframe(df.head(200))
             st.download_button('Download raw data', utils.to_excel(df), file_name=f'{name}.xlsx')
 
         st.write('''### View Feature''')
-        temp = df.copy()
-        temp.reset_index(inplace=True)
-        feature_labels = list(
-            set(temp.columns) - {'County Name', 'State', 'county_id', 'state_id', 'pop10_sqmi', 'pop2010','fips','cnty_fips','state_fips'})
-        feature_labels.sort()
+        temp = _reset_index_view(df)
+        feature_labels = _feature_labels(tuple(temp.columns),
+                                         ('County Name', 'State', 'county_id', 'state_id', 'pop10_sqmi',
+                                          'pop2010', 'fips', 'cnty_fips', 'state_fips'))
         single_feature = st.selectbox('Feature', feature_labels, 0)
 
         visualization.make_chart(temp, single_feature, st.session_state.data_format)
@@ -90,8 +107,10 @@ def census_data_explorer():
 
         if st.checkbox('Show raw data'):
             st.subheader('Raw Data')
-            tmp_df = df.copy()
-            st.caption(str(tmp_df.shape))
+            st.caption(str(df.shape))
+            if len(df) > 200:
+                st.caption('Preview limited to the first 200 rows; the download contains the full table.')
+            tmp_df = df.head(200).copy()
             tmp_df['geom'] = tmp_df['geom'].astype(str)
             st.dataframe(tmp_df)
             st.download_button('Download raw data', utils.to_excel(df), file_name=f'{state}_data.xlsx')
@@ -102,10 +121,9 @@ def census_data_explorer():
             df = df.loc[:, ~df.columns.duplicated()]
             df['County Name'] = df['county_name']
         df.set_index(['State', 'County Name'], drop=True, inplace=True)
-        feature_labels = list(
-            set(df.columns) - {'County Name', 'county_id', 'index', 'county_name', 'Census Tract', 'geom',
-                               'state_id', 'state_name', 'tract'})
-        feature_labels.sort()
+        feature_labels = _feature_labels(tuple(df.columns),
+                                         ('County Name', 'county_id', 'index', 'county_name', 'Census Tract',
+                                          'geom', 'state_id', 'state_name', 'tract'))
         st.write('''
                 ### View Feature
                 Select a feature to view for each county
@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+import psycopg2
 import streamlit as st
 
 import queries
@@ -7,6 +9,120 @@ import visualization
 from constants import STATES, EQUITY_DATA_TABLE, TRANSPORT_DATA_TABLE, LINKS
 
 
+def _normalize_geo_index(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.loc[:, ~df.columns.duplicated()]
+    if 'state_name' in df.columns:
+        df['State'] = df['state_name']
+    if 'county_name' in df.columns:
+        df['County Name'] = df['county_name']
+    return df.set_index(['State', 'County Name'], drop=True)
+
+
+@st.experimental_memo(ttl=3600)
+def _combined_tract_metrics(transport_df: pd.DataFrame, climate_df: pd.DataFrame) -> pd.DataFrame:
+    """Merge the cleaned transport and climate frames, indexed by tract.
+
+    Memoized so cycling through tracts in the drill-down selectbox reruns
+    the script against a cached lookup table instead of redoing the merge.
+    """
+    combined = transport_df.merge(climate_df, on='Census Tract', suffixes=('', '_DROP')).filter(
+        regex='^(?!.*_DROP)')
+    return combined.set_index('Census Tract')
+
+
+def _vulnerability_index_section(state: str, tract_metrics: pd.DataFrame, normalized_data: dict, epc: dict,
+                                 geo_epc: pd.DataFrame):
+    """Render the customizable Equity Vulnerability Index.
+
+    Kept as a self-contained section so weight/slider changes only touch
+    this block; the upstream query and cleaning results it consumes are
+    already memoized, so a rerun here is cheap.
+    """
+    st.markdown("""---""")
+
+    st.write('''
+            ### Create Equity Vulnerability Index
+
+            Create a framework to identify Equity Geographies that are most at risk with regard to demographics, transportation access, and natural hazard risk.
+
+            ##### Customize the index
+            ''')
+
+    selected_indicators = st.multiselect('Select which indicators to use in the Transportation Vulnerability Index',
+                                         queries.VULNERABILITY_INDEX_HEADERS,
+                                         default=['Zero-Vehicle Households (%)', 'Average Commute Time (min)',
+                                                  'People of Color (%)', 'Coastal Flooding Risk Score']
+                                         )
+
+    st.write('''Select weights for each of the selected indicators. Ensure the sum of the weights is 100%.''')
+    index_value = {}
+    default_weight = round(100 / len(selected_indicators)) if selected_indicators else 0
+    weight_columns = st.columns(3)
+    for i, indicator in enumerate(selected_indicators):
+        with weight_columns[i % 3]:
+            index_value[indicator] = st.number_input(indicator, min_value=0, max_value=100,
+                                                     value=default_weight, key=indicator)
+
+    if sum(index_value.values()) > 101 or sum(index_value.values()) < 99:
+        st.error("Weights must sum to 100")
+
+    try:
+        st.write('')
+        st.write('''##### Equity Vulnerability Index''')
+        st.caption('Equity geographies are sorted based on each of the equity vulnerability index values')
+
+        # The two normalized frames cover the same tract set, so aligning on
+        # the tract index and concatenating sideways is cheaper than an
+        # outer hash-join plus suffixing and regex-dropping the collisions.
+        combined_normalized_data = pd.concat(
+            [normalized_data['Transportation'].set_index('Census Tract')[queries.TRANSPORT_CENSUS_HEADERS],
+             normalized_data['Climate'].set_index('Census Tract')[queries.CLIMATE_CENSUS_HEADERS]],
+            axis=1, join='outer').reset_index()
+        weights = np.array([index_value[c] for c in selected_indicators], dtype=np.float64)
+        index_matrix = combined_normalized_data[selected_indicators].to_numpy(dtype=np.float64)
+        transport_index = pd.Series(index_matrix @ weights, index=combined_normalized_data['Census Tract'],
+                                    name='Index Value')
+        transport_index.sort_values(ascending=False, inplace=True)
+
+        # Long form is only needed for the stacked chart, so build it after
+        # the index itself has been computed from the wide matrix.
+        stacked_data = combined_normalized_data.melt('Census Tract', selected_indicators, 'Indicators')
+        stacked_data.rename({'value': 'Index Value'}, axis=1, inplace=True)
+        stacked_data['Index Value'] = stacked_data['Indicators'].map(index_value) * stacked_data['Index Value']
+        visualization.make_stacked(stacked_data)
+
+        st.write('##### Locate the census tracts with the highest index values')
+        num_tracts = st.slider('Select number of census tracts to view',
+                            min_value=1, max_value=len(transport_index),
+                            value=[5 if 5 < len(transport_index) else len(transport_index)]
+                            )[0]
+
+        selected_ids = transport_index.head(num_tracts).index
+        # tract_metrics already holds the transport+climate merge over the
+        # full tract set, indexed by tract id, so the top-ranked rows can be
+        # pulled out with index lookups instead of boolean masks over the
+        # whole frame.
+        combined_epc = tract_metrics.loc[tract_metrics.index.isin(epc['Transportation']['Census Tract'])]
+        selected_tracts = combined_epc.loc[combined_epc.index.intersection(selected_ids)].reset_index()
+        selected_tracts['value'] = selected_tracts['Census Tract'].map(transport_index)
+        geo_lookup = geo_epc.set_index('Census Tract')
+        selected_geo = geo_lookup.loc[geo_lookup.index.intersection(selected_ids)].reset_index()
+        selected_geo['Index Value'] = selected_geo['Census Tract'].map(transport_index).round().astype(int)
+        visualization.make_transport_census_map(selected_geo, selected_tracts, 'Index Value', False, selected_tracts)
+
+        with st.expander('Download data at the census tract level'):
+            st.caption('Values for selected indicators are shown for the census tracts with the highest index values')
+            selected_tracts_df = tract_metrics.loc[tract_metrics.index.intersection(selected_ids),
+                queries.TRANSPORT_CENSUS_HEADERS + queries.POSITIVE_TRANSPORT_CENSUS_HEADERS]
+            st.dataframe(selected_tracts_df)
+            st.download_button('Download', utils.to_excel(selected_tracts_df),
+                            file_name=f'{state}_selected_transport_data.xlsx')
+
+    except (KeyError, ValueError, TypeError, IndexError):
+        st.error('Equity Vulnerability Index cannot be shown for this geography at this time. Please select a different region.')
+        st.stop()
+
+
 def census_equity_explorer():
     indent = 4
 
@@ -19,34 +135,42 @@ def census_equity_explorer():
     col1, col2 = st.columns((1 + indent, 1))
     with col1:
         state = st.selectbox("Select a state", STATES).strip()
-        county_list = queries.all_counties_query()
-        county_list = county_list[county_list['state_name'] == state]['county_name'].to_list()
-        county_list.sort()
+        county_list = queries.counties_by_state().get(state, [])
         counties = st.multiselect('Select a county', ['All'] + county_list)
         tables = queries.EQUITY_CENSUS_TABLES
         tables = [_.strip().lower() for _ in tables]
         tables.sort()
 
     if len(tables) > 0 and len(counties) > 0:
+        selected_counties = county_list if 'All' in counties else counties
+        transport_tables = sorted(set(_.strip().lower() for _ in queries.TRANSPORT_CENSUS_TABLES))
+        climate_tables = sorted(set(_.strip().lower() for _ in queries.CLIMATE_CENSUS_TABLES))
         try:
-            if 'All' in counties:
-                df = queries.latest_data_census_tracts(state, county_list, tables)
-            else:
-                df = queries.latest_data_census_tracts(state, counties, tables)
-        except:
-            df = pd.DataFrame()
+            fetched = queries.latest_data_census_tracts_multi(state, selected_counties, {
+                'equity': tables,
+                'transport': transport_tables,
+                'climate': climate_tables
+            })
+        except psycopg2.Error as e:
+            st.warning(f'Query failed: {e}')
+            fetched = {'equity': pd.DataFrame(), 'transport': pd.DataFrame(), 'climate': pd.DataFrame()}
+        df = fetched['equity']
 
         if st.checkbox('Show raw data'):
             st.subheader('Raw Data')
-            st.dataframe(df.iloc[:, 3:])
+            if len(df) > 200:
+                st.caption('Preview limited to the first 200 rows; the download contains the full table.')
+            st.dataframe(df.iloc[:200, 3:])
             st.download_button('Download raw data', utils.to_excel(df), file_name=f'{state}_data.xlsx')
-        if 'state_name' in df.columns:
-            df = df.loc[:, ~df.columns.duplicated()]
-            df['State'] = df['state_name']
-        if 'county_name' in df.columns:
-            df = df.loc[:, ~df.columns.duplicated()]
-            df['County Name'] = df['county_name']
-        df.set_index(['State', 'County Name'], drop=True, inplace=True)
+        df = _normalize_geo_index(df)
+
+        # Keep a single lean tract-to-geometry frame and strip the WKB
+        # payload out of the attribute pipeline so the cleaners, merges, and
+        # melts downstream never copy geometry bytes around. State and
+        # County Name come along as columns because the transport map
+        # selects them from its geo frame.
+        geo_tracts = df[['geom', 'Census Tract']].reset_index()
+        df = df.drop(columns=['geom'])
 
         df = queries.clean_equity_data(df)
 
@@ -92,13 +216,8 @@ def census_equity_explorer():
             equity_df, total_census_tracts, concentration_thresholds, equity_averages, equity_epc_averages = queries.get_equity_geographies(
                 df, coeff[concentration])
 
-            geo_df = equity_df.copy()
-            geo_total = total_census_tracts.copy()
+            geo_total = geo_tracts.loc[geo_tracts['Census Tract'].isin(total_census_tracts['Census Tract'])].copy()
             df_copy = equity_df.copy()
-            equity_df.drop(['geom'], inplace=True, axis=1)
-            total_census_tracts.drop(['geom'], inplace=True, axis=1)
-            geo_df = geo_df[['geom', 'Census Tract']]
-            geo_total = geo_total[['geom', 'Census Tract']]
 
             visualization.make_equity_census_map(geo_total, total_census_tracts, 'Criteria')
 
@@ -108,7 +227,7 @@ def census_equity_explorer():
                         ''')
                 st.caption('*concentration threshold = average + (standard deviation x coefficient)*')
                 st.write('Coefficients default to be 0.5. Coefficients can be increased to 1 or 1.5 to narrow the search.')
-        except:
+        except (KeyError, ValueError, TypeError, IndexError):
             st.error('Equity Geographies cannot be shown for this geography at this time. Please select a different region.')
             st.stop()
             
@@ -121,8 +240,8 @@ def census_equity_explorer():
                 Analyze demographic data, transportation considerations, and natural hazard risk for vulnerable communities in the county.          
                 ''')
 
-        header_selection = {'Demographic Factors':  [x + ' (%)' for x in queries.EQUITY_CENSUS_POC_LOW_INCOME] + [x + ' (%)' for x in queries.EQUITY_CENSUS_REMAINING_HEADERS], 
-                            'Transportation': queries.TRANSPORT_CENSUS_HEADERS, 
+        header_selection = {'Demographic Factors': list(queries.EQUITY_CENSUS_PCT_HEADERS),
+                            'Transportation': queries.TRANSPORT_CENSUS_HEADERS,
                             'Climate': queries.CLIMATE_CENSUS_HEADERS}
 
         selected_category = st.selectbox('Select category for analysis', header_selection.keys())
@@ -147,25 +266,8 @@ def census_equity_explorer():
         #     st.download_button('Download selected data', utils.to_excel(df[filter_data]),
         #                        file_name=f'{state}_{filter_level}.xlsx')
         try:
-            tables = queries.TRANSPORT_CENSUS_TABLES
-            tables = [_.strip().lower() for _ in tables]
-            tables.sort()
-
-            if len(tables) > 0 and len(counties) > 0:
-                try:
-                    if 'All' in counties:
-                        transport_df = queries.latest_data_census_tracts(state, county_list, tables)
-                    else:
-                        transport_df = queries.latest_data_census_tracts(state, counties, tables)
-                except:
-                    transport_df = pd.DataFrame()
-
-            transport_df = transport_df.loc[:, ~transport_df.columns.duplicated()]
-            if 'state_name' in transport_df.columns:
-                transport_df['State'] = transport_df['state_name']
-            if 'county_name' in transport_df.columns:
-                transport_df['County Name'] = transport_df['county_name']
-            transport_df.set_index(['State', 'County Name'], drop=True, inplace=True)
+            transport_df = _normalize_geo_index(fetched['transport'])
+            transport_df = transport_df.drop(columns=['geom'])
 
             epc = {'Demographic Factors': df_copy}
             df = {'Demographic Factors': geo_total}
@@ -175,27 +277,11 @@ def census_equity_explorer():
             
             epc['Transportation'], df['Transportation'], normalized_data['Transportation'], averages['Transportation'], epc_averages['Transportation'] = queries.clean_transport_data(transport_df, df_copy)
 
-            geo_df = df['Transportation'].copy()[['geom', 'Census Tract']]
-            geo_epc = epc['Transportation'].copy()[['geom', 'Census Tract']]
-            
-            tables = queries.CLIMATE_CENSUS_TABLES
-            tables = [_.strip().lower() for _ in tables]
-            tables.sort()
-
-            if len(tables) > 0 and len(counties) > 0:
-                try:
-                    if 'All' in counties:
-                        climate_df = queries.latest_data_census_tracts(state, county_list, tables)
-                    else:
-                        climate_df = queries.latest_data_census_tracts(state, counties, tables)
-                except:
-                    climate_df = pd.DataFrame()
-            climate_df = climate_df.loc[:, ~climate_df.columns.duplicated()]
-            if 'state_name' in climate_df.columns:
-                climate_df['State'] = climate_df['state_name']
-            if 'county_name' in climate_df.columns:
-                climate_df['County Name'] = climate_df['county_name']
-            climate_df.set_index(['State', 'County Name'], drop=True, inplace=True)
+            geo_df = geo_tracts.loc[geo_tracts['Census Tract'].isin(df['Transportation']['Census Tract'])].copy()
+            geo_epc = geo_tracts.loc[geo_tracts['Census Tract'].isin(epc['Transportation']['Census Tract'])].copy()
+
+            climate_df = _normalize_geo_index(fetched['climate'])
+            climate_df = climate_df.drop(columns=['geom'])
 
             epc['Climate'], df['Climate'], normalized_data['Climate'], averages['Climate'], epc_averages['Climate'] = queries.clean_climate_data(climate_df, df_copy)
 
@@ -217,128 +303,46 @@ def census_equity_explorer():
             
             visualization.make_transport_census_map(filter_map[radio_data]['geo'], filter_map[radio_data]['data'], feature, show_transit, filter_map['Equity Geographies only']['data'])
 
-            epc[selected_category].drop(['geom'], inplace=True, axis=1)
-            df[selected_category].drop(['geom'], inplace=True, axis=1)
             st.write(f'##### How large is the disparity?')
 
             visualization.make_transport_census_chart(epc[selected_category], averages[selected_category], feature)
             
             with st.expander('Drill down to census-tract level data', expanded=False):
                 st.caption('Select a census tract from the list below to investigate demographic, transportation, and climate risk data.')
-                df = df['Transportation'].merge(df['Climate'], on='Census Tract', suffixes=('', '_DROP')).filter(
-                    regex='^(?!.*_DROP)')
-                df.set_index('Census Tract', inplace=True)
+                df = _combined_tract_metrics(df['Transportation'], df['Climate'])
                 selected_tract = st.selectbox('Census Tract ID', df.index.unique()) #selected_tracts['Census Tract]
                 averages = {**averages['Transportation'], **averages['Climate']}
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    for header in queries.TRANSPORT_CENSUS_HEADERS[(int(len(queries.TRANSPORT_CENSUS_HEADERS) / 2)):]:
-                        st.metric(header,
-                                value=str(round(df.loc[selected_tract, header], 1)) + queries.TABLE_UNITS[header],
-                                delta=str(round(df.loc[selected_tract, header] - averages[header], 1)) +
-                                        queries.TABLE_UNITS[header] + ' from county average')
-                with col2:
-                    for header in queries.TRANSPORT_CENSUS_HEADERS[:(int(len(queries.TRANSPORT_CENSUS_HEADERS) / 2))]:
-                        st.metric(header,
-                                value=str(round(df.loc[selected_tract, header], 1)) + queries.TABLE_UNITS[header],
-                                delta=str(round(df.loc[selected_tract, header] - averages[header], 1)) +
-                                        queries.TABLE_UNITS[header] + ' from county average')
-                with col3:
-                    for header in queries.CLIMATE_CENSUS_HEADERS:
-                        st.metric(header,
-                                value=str(round(df.loc[selected_tract, header], 1)) + queries.TABLE_UNITS[header],
-                                delta=str(round(df.loc[selected_tract, header] - averages[header], 1)) +
-                                        queries.TABLE_UNITS[header] + ' from county average')
-        except:
+
+                # Pull the selected tract once and compute all deltas in a
+                # single Series pass instead of a .loc lookup per metric.
+                metric_headers = list(queries.VULNERABILITY_INDEX_HEADERS)
+                row = df.loc[selected_tract, metric_headers].astype(float).round(1)
+                delta = (row - pd.Series(averages).reindex(metric_headers)).round(1)
+
+                half = int(len(queries.TRANSPORT_CENSUS_HEADERS) / 2)
+                header_groups = [queries.TRANSPORT_CENSUS_HEADERS[half:],
+                                 queries.TRANSPORT_CENSUS_HEADERS[:half],
+                                 queries.CLIMATE_CENSUS_HEADERS]
+                # Render all ~18 metrics in one markdown block instead of one
+                # st.metric component per value, so a tract change costs a
+                # single frontend update rather than a round-trip per metric.
+                group_html = []
+                for headers in header_groups:
+                    items = ''.join(
+                        f'<div style="margin-bottom:0.75rem"><b>{header}</b><br>'
+                        f'<span style="font-size:1.5rem">{row[header]}{queries.TABLE_UNITS[header]}</span><br>'
+                        f'<small style="color:{"green" if delta[header] >= 0 else "red"}">'
+                        f'{delta[header]:+}{queries.TABLE_UNITS[header]} from county average</small></div>'
+                        for header in headers)
+                    group_html.append(f'<div style="flex:1">{items}</div>')
+                st.markdown('<div style="display:flex;gap:1rem">' + ''.join(group_html) + '</div>',
+                            unsafe_allow_html=True)
+        except (KeyError, ValueError, TypeError, IndexError):
             st.error('Equity and vulnerability indicators cannot be shown for this geography at this time. Please select a different region.')
             st.stop()  
             
-        st.markdown("""---""")
+        _vulnerability_index_section(state, df, normalized_data, epc, geo_epc)
 
-        st.write('''
-                ### Create Equity Vulnerability Index
-                
-                Create a framework to identify Equity Geographies that are most at risk with regard to demographics, transportation access, and natural hazard risk.
-                
-                ##### Customize the index           
-                ''')
-
-        selected_indicators = st.multiselect('Select which indicators to use in the Transportation Vulnerability Index',
-                                             queries.TRANSPORT_CENSUS_HEADERS+queries.CLIMATE_CENSUS_HEADERS,
-                                             default=['Zero-Vehicle Households (%)', 'Average Commute Time (min)',
-                                                      'People of Color (%)', 'Coastal Flooding Risk Score']
-                                             )
-
-        st.write('''Select weights for each of the selected indicators. Ensure the sum of the weights is 100%.''')
-        index_value = {}
-        dynamic_col1, dynamic_col2, dynamic_col3 = st.columns(3)
-        for i, indicator in enumerate(selected_indicators):
-            position = i % 3
-            if position == 0:
-                with dynamic_col1:
-                    index_value[indicator] = st.number_input(indicator, min_value=0, max_value=100,
-                                                             value=round((100 / len(selected_indicators))),
-                                                             key=indicator)
-            elif position == 1:
-                with dynamic_col2:
-                    index_value[indicator] = st.number_input(indicator, min_value=0, max_value=100,
-                                                             value=round((100 / len(selected_indicators))),
-                                                             key=indicator)
-            elif position == 2:
-                with dynamic_col3:
-                    index_value[indicator] = st.number_input(indicator, min_value=0, max_value=100,
-                                                             value=round((100 / len(selected_indicators))),
-                                                             key=indicator)
-
-        if sum(index_value.values()) > 101 or sum(index_value.values()) < 99:
-            st.error("Weights must sum to 100")
-
-        try:
-            st.write('')
-            st.write('''##### Equity Vulnerability Index''')
-            st.caption('Equity geographies are sorted based on each of the equity vulnerability index values')
-
-            combined_normalized_data = normalized_data['Transportation'].merge(normalized_data['Climate'],how='outer', on='Census Tract', suffixes=('', '_DROP')).filter(
-                regex='^(?!.*_DROP)')
-            combined_normalized_data = combined_normalized_data.melt('Census Tract', selected_indicators, 'Indicators')
-            combined_normalized_data.rename({'value': 'Index Value'}, axis=1, inplace=True)
-            combined_normalized_data['Index Value'] = combined_normalized_data['Indicators'].apply(lambda x: index_value[x]) * \
-                                            combined_normalized_data['Index Value']
-            transport_index = combined_normalized_data.groupby(['Census Tract'])['Index Value'].sum()
-            visualization.make_stacked(combined_normalized_data)
-
-            transport_index.sort_values(ascending=False, inplace=True)
-
-            st.write('##### Locate the census tracts with the highest index values')
-            num_tracts = st.slider('Select number of census tracts to view',
-                                min_value=1, max_value=len(transport_index),
-                                value=[5 if 5 < len(transport_index) else len(transport_index)]
-                                )[0]
-
-            selected = transport_index.head(num_tracts).reset_index()
-            combined_epc = epc['Transportation'].merge(epc['Climate'],how='outer', on='Census Tract', suffixes=('', '_DROP')).filter(
-                regex='^(?!.*_DROP)')
-            selected_tracts = combined_epc.copy().loc[combined_epc['Census Tract'].isin(selected['Census Tract'])]
-            selected_tracts['value'] = selected_tracts['Census Tract'].apply(lambda x: transport_index.loc[x])
-            selected_geo = geo_epc.copy().loc[geo_epc['Census Tract'].isin(selected['Census Tract'])]
-            selected_geo['Index Value'] = selected_geo['Census Tract'].apply(lambda x: round(transport_index.loc[x]))
-            selected_geo_copy = selected_geo.copy()
-            selected_tracts_copy = selected_tracts.copy()
-            visualization.make_transport_census_map(selected_geo, selected_tracts, 'Index Value', False, selected_tracts)
-            
-            with st.expander('Download data at the census tract level'):
-                st.caption('Values for selected indicators are shown for the census tracts with the highest index values')
-                selected_tracts_df = df.loc[(df.index).isin(selected['Census Tract'])][
-                    queries.TRANSPORT_CENSUS_HEADERS + queries.POSITIVE_TRANSPORT_CENSUS_HEADERS]
-                st.dataframe(selected_tracts_df)
-                st.download_button('Download', utils.to_excel(selected_tracts_df),
-                                file_name=f'{state}_selected_transport_data.xlsx')
-   
-        except:
-            st.error('Equity Vulnerability Index cannot be shown for this geography at this time. Please select a different region.')
-            st.stop()
-        
        # EXPLORE OPTIONS TO ADD RASTER FLOODMAP DATA
         # st.markdown("""---""")
 
@@ -157,14 +157,13 @@ def eviction_UI():
                 st.write(
                     "There are some counties that don't show up in this analysis because of how they are named or because data is missing. We are aware of this issue.")
 
-            frames = []
-            for state in STATES:
-                df = queries.get_county_data(state)
-                frames.append(df)
-            natl_df = pd.concat(frames)
+            # One batched national query instead of fifty per-state rounds.
+            natl_df = queries.get_national_county_data()
             if st.checkbox('Show raw data'):
                 st.subheader('Raw Data')
-                st.dataframe(natl_df)
+                if len(natl_df) > 200:
+                    st.caption('Preview limited to the first 200 rows; the download contains the full table.')
+                st.dataframe(natl_df.head(200))
                 st.download_button('Download raw data', utils.to_excel(natl_df), file_name=f'national_data.xlsx')
             with st.expander('Cost to avoid evictions'):
                 st.write("""
@@ -234,7 +233,9 @@ def relative_risk_ranking(df: pd.DataFrame, label: str) -> pd.DataFrame:
     ranks['county_id'] = df['county_id']
     ranks['state_id'] = df['state_id']
     st.write('Higher values correspond to more relative risk. Values can be between 0 and 1.')
-    st.dataframe(ranks['Relative Risk'])
+    if len(ranks) > 200:
+        st.caption('Preview limited to the first 200 rows; the download contains the full ranking.')
+    st.dataframe(ranks['Relative Risk'].head(200))
     st.download_button('Download Relative Risk ranking', utils.to_excel(ranks), file_name=f'{label}_data.xlsx')
 
     return ranks
@@ -1,3 +1,4 @@
+import functools
 import os
 import sys
 import psycopg2
@@ -94,6 +95,13 @@ POSITIVE_TRANSPORT_CENSUS_HEADERS = [
     'Bicycle Commuters (%)'
 ]
 
+# Derived header lists built once at import instead of via list
+# comprehensions on every Streamlit rerun.
+EQUITY_CENSUS_PCT_HEADERS = tuple(
+    f'{x} (%)' for x in EQUITY_CENSUS_POC_LOW_INCOME + EQUITY_CENSUS_REMAINING_HEADERS
+)
+VULNERABILITY_INDEX_HEADERS = tuple(TRANSPORT_CENSUS_HEADERS + CLIMATE_CENSUS_HEADERS)
+
 TABLE_UNITS = {
     'burdened_households': '%',
     'homeownership_rate': '%',
@@ -194,6 +202,7 @@ def init_engine():
     return engine
 
 
+@st.experimental_singleton
 def init_connection():
     if st.secrets:
         conn = psycopg2.connect(**st.secrets["postgres"])
@@ -208,11 +217,26 @@ def init_connection():
     return conn
 
 
+def downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """Shrink float64/int64 columns to the smallest dtype that fits.
+
+    Census values arrive from the driver as 64-bit; percentages and counts
+    fit comfortably in 32 bits, which halves the bytes every downstream
+    merge, groupby, and melt has to move.
+    """
+    for col in df.select_dtypes('float64').columns:
+        df[col] = pd.to_numeric(df[col], downcast='float')
+    for col in df.select_dtypes('int64').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
 def write_table(df: pd.DataFrame, table: str):
     engine = init_engine()
     df.to_sql(table, engine, if_exists='replace', method='multi')
 
 
+@st.experimental_memo(ttl=3600)
 def all_counties_query(where: str = None) -> pd.DataFrame:
     conn = init_connection()
     cur = conn.cursor()
@@ -228,6 +252,12 @@ def all_counties_query(where: str = None) -> pd.DataFrame:
     return df
 
 
+@st.experimental_memo(ttl=3600)
+def counties_by_state() -> dict:
+    df = all_counties_query()
+    return df.groupby('state_name')['county_name'].apply(lambda s: sorted(s.tolist())).to_dict()
+
+
 def table_names_query() -> list:
     conn = init_connection()
     cur = conn.cursor()
@@ -269,7 +299,7 @@ def read_table(table: str, columns: list = None, where: str = None, order_by: st
     return df
 
 
-@st.experimental_memo(ttl=1200)
+@st.experimental_memo(ttl=3600)
 def latest_data_census_tracts(state: str, counties: list, tables: list) -> pd.DataFrame:
     conn = init_connection()
     cur = conn.cursor()
@@ -297,9 +327,64 @@ def latest_data_census_tracts(state: str, counties: list, tables: list) -> pd.Da
         tracts_df = tracts_df.merge(df, on="Census Tract", how="inner", suffixes=('', '_y'))
         tracts_df.drop(tracts_df.filter(regex='_y$').columns.tolist(), axis=1, inplace=True)
         tracts_df = tracts_df.loc[:, ~tracts_df.columns.duplicated()]
-    return tracts_df
+    tracts_df['Census Tract'] = tracts_df['Census Tract'].astype('category')
+    return downcast_numeric(tracts_df)
+
+
+@st.experimental_memo(ttl=3600)
+def latest_data_census_tracts_multi(state: str, counties: list, table_groups: dict) -> dict:
+    """Fetch several groups of census tract tables in one round of queries.
+
+    Each distinct table is queried once even when it appears in multiple
+    groups, and the tract geometries are fetched a single time, so callers
+    pay for one set of round-trips instead of one per group.
+    """
+    conn = init_connection()
+    cur = conn.cursor()
+    tracts_df = census_tracts_geom_query(counties, state)
+    counties_str = str(tuple(counties)).replace(',)', ')')
+    where_clause = f"WHERE id_index.state_name ='{state}' AND id_index.county_name IN {counties_str}"
+
+    table_frames = {}
+    for table_name in sorted(set().union(*table_groups.values())):
+        query = f"""SELECT {table_name}.*, id_index.county_name, id_index.county_id, id_index.state_name, id_index.tract_id,
+        resident_population_census_tract.tot_population_census_2010
+            FROM {table_name}
+            INNER JOIN id_index ON {table_name}.tract_id = id_index.tract_id
+            INNER JOIN resident_population_census_tract ON {table_name}.tract_id = resident_population_census_tract.tract_id
+            {where_clause};"""
+        cur.execute(query)
+        results = cur.fetchall()
+        conn.commit()
+
+        colnames = [desc[0] for desc in cur.description]
+        df = pd.DataFrame(results, columns=colnames)
+        df = df.loc[:, ~df.columns.duplicated()]
+        df.rename({'tract_id': 'Census Tract'}, axis=1, inplace=True)
+        table_frames[table_name] = df
+
+    group_frames = {}
+    for group, tables in table_groups.items():
+        group_df = tracts_df.copy()
+        for table_name in tables:
+            group_df = group_df.merge(table_frames[table_name], on="Census Tract", how="inner", suffixes=('', '_y'))
+            group_df.drop(group_df.filter(regex='_y$').columns.tolist(), axis=1, inplace=True)
+            group_df = group_df.loc[:, ~group_df.columns.duplicated()]
+        group_frames[group] = downcast_numeric(group_df)
+
+    # Share one category dictionary across the groups so the merges and
+    # .isin filters between them downstream run on integer codes rather
+    # than hashing tract-id strings row by row.
+    categories = pd.Index([])
+    for group_df in group_frames.values():
+        group_df['Census Tract'] = group_df['Census Tract'].astype('category')
+        categories = categories.union(group_df['Census Tract'].cat.categories)
+    for group_df in group_frames.values():
+        group_df['Census Tract'] = group_df['Census Tract'].cat.set_categories(categories)
+    return group_frames
 
 
+@st.experimental_memo(ttl=3600)
 def load_distributions() -> tuple:
     metro_areas = generic_select_query('housing_stock_distribution', [
         'location',
@@ -315,6 +400,7 @@ def load_distributions() -> tuple:
     return metro_areas, locations
 
 
+@st.experimental_memo(ttl=1200)
 def policy_query() -> pd.DataFrame:
     conn = init_connection()
     cur = conn.cursor()
@@ -386,6 +472,10 @@ def get_all_county_data(state: str, counties: list) -> pd.DataFrame:
         demo_df = demo_df.merge(fred_df, on='county_id', how='inner', suffixes=('', '_DROP')).filter(
             regex='^(?!.*_DROP)')
 
+    return transform_county_demographics(demo_df)
+
+
+def transform_county_demographics(demo_df: pd.DataFrame) -> pd.DataFrame:
     demo_df['Non-White Population'] = (demo_df['black'] + demo_df['ameri_es'] + demo_df['asian'] + demo_df[
         'hawn_pi'] + demo_df['hispanic'] + demo_df['other'] + demo_df['mult_race'])
     demo_df['Age 19 or Under'] = (
@@ -415,6 +505,11 @@ def get_all_county_data(state: str, counties: list) -> pd.DataFrame:
     }, axis=1, inplace=True)
     demo_df.drop_duplicates(inplace=True)
     demo_df.fillna(0, inplace=True)
+    # Dictionary-encode the geography names: string ops and equality
+    # filters then run over the small category set instead of allocating
+    # a fresh Python string per row, and the columns shrink to int codes.
+    demo_df['State'] = demo_df['State'].astype('category')
+    demo_df['County Name'] = demo_df['County Name'].astype('category')
     return demo_df
 
 
@@ -603,25 +698,56 @@ def filter_state(data: pd.DataFrame, state: str) -> pd.DataFrame:
 
 
 def filter_counties(data: pd.DataFrame, counties: list) -> pd.DataFrame:
-    counties = [_.lower() for _ in counties]
+    # A set keys isin into its hash-based path instead of a list scan.
+    counties = {str(_).lower() for _ in counties}
     return data[data['County Name'].str.lower().isin(counties)]
 
 
+# The lru_cache layer keeps repeated shell-mode calls from re-parsing
+# the local cache file; the memo layer on top covers Streamlit reruns.
+@functools.lru_cache(maxsize=1)
+def _read_all_tables_excel() -> pd.DataFrame:
+    # Skip the index spill-over columns at parse time so they are never
+    # materialized and clean_data has nothing to strip.
+    return pd.read_excel('Output/all_tables.xlsx', engine='openpyxl',
+                         usecols=lambda c: not str(c).startswith('Unnamed'))
+
+
+@functools.lru_cache(maxsize=1)
+def _read_all_tables_parquet() -> pd.DataFrame:
+    return pd.read_parquet('Output/all_tables.parquet')
+
+
 @st.experimental_memo(ttl=1200)
+def load_all_tables_excel() -> pd.DataFrame:
+    return _read_all_tables_excel()
+
+
+@st.experimental_memo(ttl=1200)
+def load_all_tables_parquet() -> pd.DataFrame:
+    return _read_all_tables_parquet()
+
+
 def load_all_data() -> pd.DataFrame:
-    if os.path.exists("Output/all_tables.xlsx"):
+    # The interactive prompt has to stay outside the cache: only the
+    # local reads and the national query below are memoized, so answering
+    # the prompt the same way twice costs one load, not two. Parquet is
+    # preferred over the legacy Excel cache - it parses far faster and
+    # keeps dtypes intact across the roundtrip.
+    local = next((_ for _ in ('Output/all_tables.parquet', 'Output/all_tables.xlsx')
+                  if os.path.exists(_)), None)
+    if local is not None:
         try:
-            res = input('Previous data found. Use data from local `all_tables.xlsx`? [y/N]')
+            res = input(f'Previous data found. Use data from local `{os.path.basename(local)}`? [y/N]')
             if res.lower() == 'y' or res.lower() == 'yes':
-                df = pd.read_excel('Output/all_tables.xlsx')
-            else:
-                df = get_all_county_data()
+                return load_all_tables_parquet() if local.endswith('.parquet') else load_all_tables_excel()
         except:
-            print('Something went wrong with the Excel file. Falling back to database query.')
-            df = get_all_county_data()
-    else:
-        df = get_all_county_data()
-
+            print('Something went wrong with the local file. Falling back to database query.')
+    df = get_national_county_data()
+    try:
+        df.to_parquet('Output/all_tables.parquet', engine='pyarrow', compression='snappy')
+    except (OSError, ValueError, ImportError) as e:
+        print(f'Could not write parquet cache: {e}')
     return df
 
 
@@ -630,10 +756,10 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
 
     df.rename({'Vulnerability Index': 'COVID Vulnerability Index'}, axis=1, inplace=True)
 
-    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+    df = df.loc[:, [not str(col).startswith('Unnamed') for col in df.columns]]
     df = df.loc[:, ~df.columns.duplicated()]
 
-    return df
+    return downcast_numeric(df)
 
 
 # def clean_equity_data(data: pd.DataFrame) -> pd.DataFrame:
@@ -698,31 +824,32 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
 
 #     return data
 
+@st.experimental_memo(ttl=3600)
 def clean_climate_data(data: pd.DataFrame, epc: pd.DataFrame) -> pd.DataFrame:
     hazards = ['coastal_flooding', 'hail','hurricane','ice_storm', 'riverine_flooding','tsunami']
         # 'avalanche', 'coastal_flooding', 'cold_wave', 'drought', 'earthquake', 'hail', 'heat_wave', 'hurricane',
         #        'ice_storm', 'landslide', 'lightning', 'riverine_flooding', 'strong_wind', 'tornado', 'tsunami',
         #        'volcanic_activity', 'wildfire', 'winter_weather'
-    risk_score = ['Census Tract', 'geom', 'county_name', 'state_name']+[hazard+ '_risk_score' for hazard in hazards]
+    risk_score = ['Census Tract', 'county_name', 'state_name']+[hazard+ '_risk_score' for hazard in hazards]
 
     data.fillna(0.0, inplace=True)
     data = data[risk_score].copy()
     new_column_names = [" ".join([word.capitalize() for word in x]) for x in data.columns.str.split('_')]
     data.columns = new_column_names
-    data.rename(columns={'Census tract':'Census Tract', 'Geom':'geom', 'County Name':'county_name', 'State Name':'state_name'}, inplace=True)
+    data.rename(columns={'Census tract':'Census Tract', 'County Name':'county_name', 'State Name':'state_name'}, inplace=True)
     # st.table(epc.columns)
     # st.table(data.columns)
     averages = {}
     epc_averages = {}
 
-    for x in data.columns[4:]:
+    for x in data.columns[3:]:
         averages[x] = data[x].mean()
         epc_averages[x] = data.loc[data['Census Tract'].isin(epc['Census Tract'])][x].mean()
     climate_epc = data.loc[data['Census Tract'].isin(epc['Census Tract'])]
 
     normalized_data = data.copy()
-    normalized_data[data.columns[4:]] = preprocessing.MinMaxScaler().fit_transform(
-        normalized_data[data.columns[4:]])
+    normalized_data[data.columns[3:]] = preprocessing.MinMaxScaler().fit_transform(
+        normalized_data[data.columns[3:]])
 
     return climate_epc, data, normalized_data, averages, epc_averages
 
@@ -869,6 +996,7 @@ def clean_equity_data(data: pd.DataFrame) -> pd.DataFrame:
     return data
 
 
+@st.experimental_memo(ttl=3600)
 def clean_transport_data(data: pd.DataFrame, epc: pd.DataFrame) -> pd.DataFrame:
     # data['walkability_index'] = round(data['walkability_index'])
     data['number_drive_alone'] = data['percent_drive_alone'] * data['total_workers_commute']
@@ -975,9 +1103,24 @@ def clean_transport_data(data: pd.DataFrame, epc: pd.DataFrame) -> pd.DataFrame:
 #     return epc, df, concentration_thresholds, averages, epc_averages
 
 
+@functools.lru_cache(maxsize=1)
+def _read_policy_workbook() -> pd.DataFrame:
+    return pd.read_excel('Policy Workbook.xlsx', sheet_name='Analysis Data')
+
+
+@st.experimental_memo(ttl=1200)
+def load_policy_workbook() -> pd.DataFrame:
+    return _read_policy_workbook()
+
+
 def get_existing_policies(df: pd.DataFrame) -> pd.DataFrame:
     policy_df = policy_query()
-    temp_df = df.merge(policy_df, on='county_id')
+    if policy_df.empty:
+        # Nothing in the database policy table: skip the merge and go
+        # straight to the workbook fallback.
+        temp_df = pd.DataFrame()
+    else:
+        temp_df = df.merge(policy_df, on='county_id')
     if not temp_df.empty and len(df) == len(temp_df):
         if st._is_running_with_streamlit:
             if st.checkbox('Use existing policy data?'):
@@ -988,7 +1131,7 @@ def get_existing_policies(df: pd.DataFrame) -> pd.DataFrame:
                 return temp_df
 
     else:
-        policy_df = pd.read_excel('Policy Workbook.xlsx', sheet_name='Analysis Data')
+        policy_df = load_policy_workbook()
         temp_df = df.merge(policy_df, on='County Name')
         if not temp_df.empty and len(df) == len(temp_df):
             return temp_df
@@ -1009,12 +1152,16 @@ def get_county_data(state: str, county_ids: list = None, policy: bool = False):
 
 @st.experimental_memo(ttl=3600)
 def get_national_county_data() -> pd.DataFrame:
-    frames = []
-    for s in STATES:
-        tmp_df = get_county_data(s)
-        frames.append(tmp_df)
-    df = pd.concat(frames)
-    return df
+    # One unfiltered read of county_demographics plus one FRED batch for
+    # every county, rather than fifty sequential per-state query rounds.
+    demo_df = read_table('county_demographics')
+    county_ids = demo_df['county_id'].to_list()
+    counties_str = "(" + ",".join(["'" + str(_) + "'" for _ in county_ids]) + ")"
+    fred_df = fred_query(counties_str)
+    demo_df = demo_df.merge(fred_df, on='county_id', how='inner', suffixes=('', '_DROP')).filter(
+        regex='^(?!.*_DROP)')
+    demo_df = transform_county_demographics(demo_df)
+    return clean_data(demo_df)
 
 
 @st.experimental_memo(ttl=3600)
@@ -1023,7 +1170,7 @@ def get_national_county_geom_data(counties: list) -> pd.DataFrame:
     for c in counties:
         tmp_df = get_county_geoms()
         frames.append(tmp_df)
-    df = pd.concat(frames)
+    df = pd.concat(frames, copy=False, sort=False)
     return df
 
 
@@ -8,7 +8,6 @@ import equity_explorer
 import queries
 import analysis
 import utils
-from constants import STATES
 
 # Pandas options
 pd.options.display.max_rows = 25
@@ -93,20 +92,17 @@ def run_shell() -> pd.DataFrame:
         df = df.merge(geom, on='County Name', how='outer')
         return df
     elif task == '4':
-        frames = []
-        for state in STATES:
-            df = queries.get_county_data(state)
-            frames.append(df)
-        natl_df = pd.concat(frames)
+        # One batched national query instead of fifty per-state rounds.
+        natl_df = queries.get_national_county_data()
         cost_of_evictions = input(
             'Run an analysis to estimate the cost to avoid evictions (Y/n) ')
         if cost_of_evictions == 'y' or cost_of_evictions == '':
-            df = analysis.calculate_cost_estimate(natl_df, rent_type='fmr')
+            natl_df = analysis.calculate_cost_estimate(natl_df, rent_type='fmr')
 
         utils.output_table(natl_df, 'Output/US_national.xlsx')
         analysis_df = analysis.rank_counties(natl_df, 'US_national')
         print_summary(analysis_df, 'Output/US_national.xlsx')
-        return df
+        return natl_df
     else:
         raise Exception('INVALID INPUT! Enter a valid task number.')
 
@@ -1,15 +1,50 @@
 import base64
+import datetime
+import os
 import pandas as pd
 import numpy as np
+import xlsxwriter
 from six import BytesIO
 import geopandas as gpd
+from shapely.geometry import mapping
 import streamlit as st
 
+
+def _excel_cell(value):
+    """Coerce one cell value to a type xlsxwriter's write() accepts."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (isinstance(value, (float, datetime.date, datetime.time)) and pd.isna(value)):
+        # Blank cell for NaN/NaT, like to_excel's default na_rep.
+        return None
+    if isinstance(value, (str, int, float, bool, datetime.date, datetime.time)):
+        return value
+    # Anything else (geometries, containers, ...) is stringified,
+    # matching to_excel's fallback.
+    return str(value)
+
+
+def write_excel_stream(df: pd.DataFrame, target, sheet_name: str = 'Sheet1'):
+    """Write a DataFrame to Excel row by row in constant-memory mode.
+
+    xlsxwriter's constant_memory option keeps only the current row in
+    memory, but it requires rows to arrive in order - which pandas'
+    to_excel (column-wise writes) does not do - so the rows are streamed
+    here directly.
+    """
+    workbook = xlsxwriter.Workbook(target, {'constant_memory': True, 'nan_inf_to_errors': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    frame = df.reset_index()
+    worksheet.write_row(0, 0, [str(col) for col in frame.columns])
+    for i, row in enumerate(frame.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(i, 0, [_excel_cell(value) for value in row])
+    workbook.close()
+
+
+@st.experimental_memo(ttl=1200)
 def to_excel(df: pd.DataFrame):
     output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, sheet_name='Sheet1')
-    writer.save()
+    write_excel_stream(df, output)
     processed_data = output.getvalue()
     return processed_data
 
@@ -25,8 +60,18 @@ def get_table_download_link(df: pd.DataFrame, file_name: str, text: str) -> str:
 
 
 def output_table(df: pd.DataFrame, path: str):
-    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-    df.to_excel(path)
+    df = df.loc[:, [not str(col).startswith('Unnamed') for col in df.columns]]
+    # Dispatch on the requested extension so large intermediates can use
+    # the columnar formats; xlsx stays the default for deliverables.
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        df.to_parquet(path, engine='pyarrow')
+    elif ext == '.feather':
+        df.reset_index().to_feather(path)
+    elif ext == '.csv':
+        df.to_csv(path)
+    else:
+        write_excel_stream(df, path)
 
 
 def make_geojson(geo_df: pd.DataFrame, features: list) -> dict:
@@ -54,21 +99,22 @@ def make_geojson(geo_df: pd.DataFrame, features: list) -> dict:
     return geojson
 
 
-def convert_coordinates(row) -> list:
-    for f in row['coordinates']['features']:
-        new_coords = []
-        if f['geometry']['type'] == 'MultiPolygon':
-            f['geometry']['type'] = 'Polygon'
-            combined = []
-            for i in range(len(f['geometry']['coordinates'])):
-                combined.extend(list(f['geometry']['coordinates'][i]))
-            f['geometry']['coordinates'] = combined
-        coords = f['geometry']['coordinates']
-        for coord in coords:
-            for point in coord:
-                new_coords.append([round(point[0], 6), round(point[1], 6)])
-        f['geometry']['coordinates'] = new_coords
-    return row['coordinates']
+def convert_coordinates(feature_collection: dict) -> dict:
+    for f in feature_collection['features']:
+        geometry = f['geometry']
+        if geometry['type'] == 'MultiPolygon':
+            geometry['type'] = 'Polygon'
+            rings = [ring for polygon in geometry['coordinates'] for ring in polygon]
+        else:
+            rings = list(geometry['coordinates'])
+        if rings:
+            # One concatenate + round over all vertices instead of a
+            # Python append per point.
+            flat = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in rings], axis=0)
+            geometry['coordinates'] = np.round(flat[:, :2], 6).tolist()
+        else:
+            geometry['coordinates'] = []
+    return feature_collection
 
 
 def convert_geom(geo_df: pd.DataFrame, data_df: pd.DataFrame, map_features: list) -> dict:
@@ -85,9 +131,16 @@ def convert_geom(geo_df: pd.DataFrame, data_df: pd.DataFrame, map_features: list
         geo_df = geo_df.merge(data_df, on='Census Tract', suffixes=('', '_DROP')).filter(
             regex='^(?!.*_DROP)')
     # geo_df.fillna(0,inplace=True)
-    geo_df['geom'] = geo_df.apply(lambda row: row['geom'].buffer(0), axis=1)
-    geo_df['coordinates'] = geo_df.apply(lambda row: gpd.GeoSeries(row['geom']).__geo_interface__, axis=1)
-    geo_df['coordinates'] = geo_df.apply(lambda row: convert_coordinates(row), axis=1)
+    # Buffer the whole column through GEOS at once and build each feature
+    # collection from shapely's mapping() rather than wrapping every
+    # geometry in a throwaway GeoSeries inside a row-wise apply.
+    geoms = gpd.GeoSeries(geo_df['geom']).buffer(0)
+    geo_df['geom'] = geoms.values
+    geo_df['coordinates'] = [convert_coordinates({
+        'type': 'FeatureCollection',
+        'features': [{'id': '0', 'type': 'Feature', 'properties': {},
+                      'bbox': geom.bounds, 'geometry': mapping(geom)}],
+    }) for geom in geoms.values]
     geojson = make_geojson(geo_df, map_features)
     return geojson
 
